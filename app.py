@@ -12,4 +12,10 @@ pg = st.navigation([dashboard, experiment_details, configurations])
 # Set page configuration
 st.set_page_config(page_title="Simulation Manager", page_icon=":material/science:", layout="wide")
 
+# Imported only after set_page_config: importing db_client connects, and its error paths call st.error
+from db_client import render_mongo_status
+
+# Connection status is reported asynchronously by db_client's background ping
+render_mongo_status()
+
 pg.run()
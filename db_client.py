@@ -1,12 +1,37 @@
 import os
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
 import streamlit as st
 from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from bson import ObjectId
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Outcome of the background connectivity check, filled in by _warm_ping.
+# Kept at module level because st.session_state is not reachable from a plain thread.
+mongo_status = {"ok": None, "error": None}
+
+
+def _warm_ping(client):
+    """Ping the server off the main thread so the first render is not blocked on a cold connect"""
+    try:
+        client.admin.command('ping')
+        mongo_status["ok"] = True
+    except Exception as e:
+        mongo_status["ok"] = False
+        mongo_status["error"] = str(e)
+
+def render_mongo_status():
+    """Show the outcome of the background ping in the sidebar instead of blocking the page on it"""
+    if mongo_status["ok"] is None:
+        st.sidebar.info("Connecting to MongoDB...")
+    elif mongo_status["ok"]:
+        st.sidebar.success("Successfully connected to MongoDB!")
+    else:
+        st.sidebar.error(f"Failed to connect to MongoDB: {mongo_status['error']}")
+
 @st.cache_resource
 def get_db_client():
     """
@@ -15,22 +40,37 @@ def get_db_client():
     mongo_uri = os.getenv("MONGODB_URI")
     if not mongo_uri:
         st.error("MongoDB URI not found in environment variables!")
+        mongo_status.update(ok=False, error="MongoDB URI not found in environment variables")
         return None
 
     try:
-        # Create client with increased timeout
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        # Verify connection
-        client.admin.command('ping')
-        st.success("Successfully connected to MongoDB!")
+        # Keep a warm, bounded pool so bursts of reruns don't pay connection setup
+        client = MongoClient(
+            mongo_uri,
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=200,
+            minPoolSize=10,
+            maxIdleTimeMS=300_000,
+            waitQueueTimeoutMS=5000,
+            retryWrites=True,
+            compressors="zstd,zlib",
+            appname="simulations-platform",
+        )
+        # Verify connection in the background; server discovery is lazy anyway
+        threading.Thread(target=_warm_ping, args=(client,), daemon=True).start()
         return client
-    except ServerSelectionTimeoutError as e:
-        st.error(f"Failed to connect to MongoDB: {e}")
-        return None
     except Exception as e:
         st.error(f"Unexpected error while connecting to MongoDB: {e}")
+        mongo_status.update(ok=False, error=str(e))
         return None
 
+@lru_cache(maxsize=128)
+def object_id(simulation_id):
+    """
+    Parse a simulation id into an ObjectId once per process; pages query the same id on every rerun.
+    """
+    return ObjectId(simulation_id)
+
 # Create the client
 db_client = get_db_client()
 
@@ -1,72 +1,326 @@
+import heapq
+import importlib.util
 import os
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 import torch
+try:
+    from llm.bandwidth_analysis import analyze_bandwidth_for_chat
+except ImportError:
+    analyze_bandwidth_for_chat = None
+from llm.query_cache import DiskResponseCache, QueryCache, context_signature
 from llm.retrieval import get_query_results, setup_vector_search_index, get_all_multi_experiment_documents, get_all_single_experiment_documents
 from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
-import pandas as pd
-import io
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import re
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 
 load_dotenv()
 
 # Change to a small model that's definitely available on the free tier
-model_name = os.getenv("MODEL_NAME")
+MODEL_NAME = os.getenv("MODEL_NAME")
+
+# Resolved once at import instead of on every read
+FRAMEWORK_PATH = Path(__file__).resolve().parent.parent / "floodns" / "doc" / "framework.md"
+
 
 # Read FloodNS framework.md as static context for all prompts
 def get_framework_context():
     """Read FloodNS framework.md to provide key concepts as context for LLM prompts"""
-    framework_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                               "floodns", "doc", "framework.md")
     try:
-        with open(framework_path, "r") as f:
-            framework_content = f.read()
-        return framework_content
+        return FRAMEWORK_PATH.read_text(encoding="utf-8")
     except Exception as e:
         return "Framework document could not be loaded. Key concepts include: Network, Node, Link, Flow, Connection, Event, Aftermath, and Simulator."
 
-# Load the framework context once when the module is imported
+# Load the framework context once when the module is imported; it is baked into the prompt
+# segments and tokenized once below, so edits to framework.md need a restart
 FRAMEWORK_CONTEXT = get_framework_context()
 
 
+# Prompt segments for generate_response. The framework block never changes, so it is
+# rendered into its segment once here instead of being re-formatted on every query.
+_MULTI_PROMPT_HEADER_TMPL = """You are an AI assistant performing COMPREHENSIVE COMPARATIVE ANALYSIS across multiple network simulation experiments.
+
+{data_access}
+
+**ANALYSIS SCOPE:**
+- {num_experiments} different experiments: {experiment_names}
+- {num_files} total data files analyzed
+- {coverage}
+
+**EXPERIMENT DETAILS:**
+{experiment_summary}
+
+"""
+_MULTI_PROMPT_FRAMEWORK = f"""**ANALYSIS INSTRUCTIONS:**
+- Compare data across ALL experiments
+- Identify patterns, differences, and performance metrics
+- For "which performed best" questions, analyze all relevant metrics and provide rankings
+- Extract specific numbers and statistics from the data
+- Clearly identify which experiment each data point comes from
+
+## FloodNS Framework Concepts:
+{FRAMEWORK_CONTEXT}
+
+"""
+_MULTI_PROMPT_DATASET_TMPL = "## {completeness} Multi-Experiment Dataset ({num_files} files):\n"
+_MULTI_PROMPT_QUESTION_TMPL = """
+
+**User Question:** {query}
+
+**Provide comprehensive comparative analysis based on ALL available simulation data:**"""
+
+_SINGLE_PROMPT_HEADER_TMPL = """You are an AI assistant performing COMPREHENSIVE ANALYSIS of network simulation data.
+
+{data_access}
+
+**ANALYSIS SCOPE:**
+- {num_files} total data files analyzed
+- {coverage}
+
+"""
+_SINGLE_PROMPT_FRAMEWORK = f"""**ANALYSIS INSTRUCTIONS:**
+- Analyze ALL available data files for comprehensive insights
+- Extract specific numbers, statistics and factual information from the provided data
+- If the data contains CSV content, analyze the structure and count unique entries if needed
+- For node counts, count unique node IDs. For bandwidth questions, look for numerical values
+- Provide detailed analysis based on ALL available simulation data
+
+## FloodNS Framework Concepts:
+{FRAMEWORK_CONTEXT}
+
+"""
+_SINGLE_PROMPT_DATASET_TMPL = "## {completeness} Single-Experiment Dataset ({num_files} files):\n"
+# Scope wording for the prompt headers, depending on whether MAX_CONTEXT_DOCS dropped documents
+_MULTI_DATA_ACCESS_ALL = "IMPORTANT: You have access to ALL simulation data from ALL selected experiments. Use this complete dataset to provide thorough comparative analysis."
+_MULTI_DATA_ACCESS_CAPPED = "IMPORTANT: You have the {num_files} most relevant of {total_files} data files from the selected experiments. Base your comparison on these and say so when an answer may depend on files that are not included."
+_SINGLE_DATA_ACCESS_ALL = "IMPORTANT: You have access to ALL simulation files from this experiment. Use this complete dataset to provide thorough analysis."
+_SINGLE_DATA_ACCESS_CAPPED = "IMPORTANT: You have the {num_files} most relevant of {total_files} data files from this experiment. Base your analysis on these and say so when an answer may depend on files that are not included."
+_MULTI_COVERAGE_ALL = "Complete data coverage for accurate comparison"
+_SINGLE_COVERAGE_ALL = "Complete data coverage for accurate analysis"
+_COVERAGE_CAPPED = "Partial data coverage: {num_files} of {total_files} files, selected by relevance to the question"
+
+_SINGLE_PROMPT_QUESTION_TMPL = """
+
+**User Question:** {query}
+
+**Provide comprehensive analysis based on ALL available simulation data:**"""
+
+
+def _keyword_pattern(keywords):
+    """Compile a keyword list into one alternation so a query is scanned once per bucket"""
+    return re.compile("|".join(re.escape(kw) for kw in keywords))
+
+
+# Keyword buckets used to route queries, compiled once at import
+BANDWIDTH_PATTERN = _keyword_pattern(['bandwidth', 'throughput', 'speed', 'data rate'])
+FILE_PATTERN = _keyword_pattern(['flow', 'flow_bandwidth', 'flow bandwidth', 'flow_bandwidth.csv'])
+STAT_PATTERN = _keyword_pattern(['average', 'avg', 'mean', 'statistics', 'calculate', 'median', 'min', 'max'])
+REASONING_PATTERN = _keyword_pattern(["step by step", "explain your thinking", "show your work", "reasoning"])
+
+# In-memory cache of generated answers keyed by query, run dir and retrieved documents
+QUERY_CACHE = QueryCache(max_entries=512, ttl=300)
+
+# Second tier behind QUERY_CACHE: model responses persisted across restarts
+RESPONSE_DISK_CACHE = DiskResponseCache(
+    os.getenv("LLM_CACHE_PATH") or str(Path(__file__).resolve().parent.parent / ".llm_cache.sqlite3")
+)
+
+# Upper bound on documents included in a single RAG prompt
+MAX_CONTEXT_DOCS = 50
+
+# Numeric tokens in raw CSV text, used when the CSV itself cannot be parsed
+NUMBER_PATTERN = re.compile(r'[\d.]+')
+
+
+def _csv_head_tail(text, head=5, tail=3, min_lines=10):
+    """
+    Return the first `head` and last `tail` lines of CSV text joined by an ellipsis line.
+
+    Newlines are located with find/rfind so only the two ends of the text are copied.
+    Returns None when the text has `min_lines` lines or fewer.
+    """
+    head_end = -1
+    for _ in range(head):
+        head_end = text.find('\n', head_end + 1)
+        if head_end == -1:
+            return None
+
+    tail_start = len(text)
+    for _ in range(tail):
+        tail_start = text.rfind('\n', 0, tail_start)
+        if tail_start <= head_end:
+            return None
+
+    # Make sure there are enough lines between the two ends
+    pos = head_end
+    for _ in range(min_lines - head - tail):
+        pos = text.find('\n', pos + 1, tail_start)
+        if pos == -1:
+            return None
+
+    return text[:head_end] + '\n...\n' + text[tail_start + 1:]
+
+
+OLLAMA_URL = "http://localhost:11434/api/generate"
+# OpenAI-compatible server with continuous batching (e.g. vLLM or TGI), such as http://localhost:8000/v1
+LOCAL_LLM_SERVER_URL = os.getenv("LOCAL_LLM_SERVER_URL")
+# (connect, read) timeouts for requests to local model servers (Ollama, vLLM/TGI)
+LOCAL_LLM_TIMEOUT = (3, 120)
+# Sampling temperatures; only greedy (0) generations are persisted in RESPONSE_DISK_CACHE.
+# OLLAMA_TEMPERATURE unset (None) keeps the Ollama model's own sampling defaults.
+OLLAMA_TEMPERATURE = float(os.environ["OLLAMA_TEMPERATURE"]) if os.getenv("OLLAMA_TEMPERATURE") else None
+API_TEMPERATURE = 0.7
+
+# Shared session so calls to local model servers (Ollama, vLLM/TGI) reuse keep-alive connections
+_LOCAL_LLM_SESSION = requests.Session()
+_LOCAL_LLM_SESSION.mount(
+    "http://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2)),
+)
+
+
+def _cached_generation(model_name, prompt, generate, on_token=None, temperature=0):
+    """
+    Return the persisted response for (model, prompt), calling `generate` on a miss.
+
+    Sampled generations (temperature > 0, or None for the backend's own default)
+    bypass the disk cache, so one random sample is never replayed across restarts.
+    """
+    if temperature is None or temperature > 0:
+        return generate()
+    key = DiskResponseCache.make_key(model_name, prompt)
+    cached = RESPONSE_DISK_CACHE.get(key)
+    if cached is not None:
+        if on_token:
+            on_token(cached)
+        return cached
+    response = generate()
+    RESPONSE_DISK_CACHE.set(key, response)
+    return response
+
+
+def _ollama_generate(prompt, model_name="deepseek-r1:1.5b", on_token=None):
+    """
+    Call the local Ollama server, raising on any transport or HTTP error.
+
+    If `on_token` is given, the completion is streamed and each chunk is passed
+    to it as it arrives; the full text is still returned.
+    """
+    return _cached_generation(
+        model_name, prompt, lambda: _ollama_request(prompt, model_name, on_token), on_token, OLLAMA_TEMPERATURE
+    )
+
+
+def _ollama_request(prompt, model_name, on_token=None):
+    stream = on_token is not None
+    response = _LOCAL_LLM_SESSION.post(
+        OLLAMA_URL,
+        timeout=LOCAL_LLM_TIMEOUT,
+        headers={"Content-Type": "application/json"},
+        data=orjson.dumps({
+            "model": model_name,
+            "prompt": prompt,
+            "stream": stream,
+            **({"options": {"temperature": OLLAMA_TEMPERATURE}} if OLLAMA_TEMPERATURE is not None else {})
+        }),
+        stream=stream
+    )
+    response.raise_for_status()
+    if not stream:
+        result = orjson.loads(response.content)
+        return result.get("response", "").strip()
+
+    # Streamed responses are newline-delimited JSON objects
+    chunks = []
+    for line in response.iter_lines():
+        if not line:
+            continue
+        result = orjson.loads(line)
+        chunk = result.get("response", "")
+        if chunk:
+            chunks.append(chunk)
+            on_token(chunk)
+        if result.get("done"):
+            break
+    return "".join(chunks).strip()
+
+
 def generate_with_ollama(prompt, model_name="deepseek-r1:1.5b"):
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False
-            })
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result.get("response", "").strip()
+        return _ollama_generate(prompt, model_name)
     except Exception as e:
         return "There was an error calling the local model through Ollama."
 
 
-def generate_response(query, run_dir=None):
-    """Generate a response using DeepSeek model based on retrieved context"""
+def _doc_relevance(doc, query_terms):
+    """Cheap relevance proxy: the vector search score if present, then query terms found in the filename"""
+    filename = doc.get("filename", "").lower()
+    return (doc.get("score", 0), sum(term in filename for term in query_terms))
+
+
+def _select_context_docs(context_docs, query_terms, limit):
+    """
+    Keep at most `limit` documents, ranked by relevance within each experiment and taken
+    round-robin across experiments, so a comparative prompt keeps every experiment represented
+    """
+    by_experiment = defaultdict(list)
+    for doc in context_docs:
+        by_experiment[doc.get("experiment_name")].append(doc)
+    ranked = [
+        iter(heapq.nlargest(limit, docs, key=lambda doc: _doc_relevance(doc, query_terms)))
+        for docs in by_experiment.values()
+    ]
+
+    selected = []
+    while ranked and len(selected) < limit:
+        for docs in list(ranked):
+            doc = next(docs, None)
+            if doc is None:
+                ranked.remove(docs)
+                continue
+            selected.append(doc)
+            if len(selected) == limit:
+                break
+
+    # Keep retrieval order, which groups documents by experiment for the prompt
+    selected_ids = {id(doc) for doc in selected}
+    return [doc for doc in context_docs if id(doc) in selected_ids]
+
+
+def generate_response(query, run_dir=None, on_token=None):
+    """
+    Generate a response using DeepSeek model based on retrieved context.
+
+    If `on_token` is given, the model's answer is streamed to it chunk by chunk
+    so the UI can render it before generation finishes. The complete response,
+    including the sources block, is returned either way.
+    """
     try:
-        # First check if this is a bandwidth analysis question
-        if is_bandwidth_query(query):
+        # Normalize once and reuse for every keyword check below
+        query_lower = query.lower()
+        
+        # First check if this is a bandwidth analysis question (needs a run directory)
+        if run_dir and analyze_bandwidth_for_chat is not None and is_bandwidth_query(query, query_lower):
             try:
-                # Import here to avoid circular imports
-                from llm.bandwidth_analysis import analyze_bandwidth_for_chat
-                
-                # Only use bandwidth analysis if we have a run directory
-                if run_dir:
-                    return analyze_bandwidth_for_chat(run_dir=run_dir, query=query)
-                    except Exception as e:
-            # Continue with standard response generation if bandwidth analysis fails
-            pass
+                return analyze_bandwidth_for_chat(run_dir=run_dir, query=query)
+            except Exception as e:
+                # Continue with standard response generation if bandwidth analysis fails
+                pass
         
         # Check if this is a request for step-by-step reasoning
-        if any(phrase in query.lower() for phrase in ["step by step", "explain your thinking", "show your work", "reasoning"]):
+        if REASONING_PATTERN.search(query_lower):
             return generate_response_with_reasoning(query)
         
         # Standard response generation
@@ -84,37 +338,64 @@ def generate_response(query, run_dir=None):
             else:
                 return "I couldn't find any simulation data to answer your question."
         
-        # Extract text, filenames, and experiment info for context
+        # Bound prompt size (and the work below) by keeping only the most relevant documents
+        total_docs = len(context_docs)
+        is_capped = total_docs > MAX_CONTEXT_DOCS
+        if is_capped:
+            query_terms = {term for term in re.findall(r"[a-z_]+", query_lower) if len(term) > 3}
+            context_docs = _select_context_docs(context_docs, query_terms, MAX_CONTEXT_DOCS)
+        
+        # Repeated questions over the same retrieved documents skip the model call
+        cache_key = QueryCache.make_key(query, run_dir, context_signature(context_docs))
+        cached_response = QUERY_CACHE.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+        
+        # Extract text, filenames, and experiment info for context in a single pass
         contexts = []
         filenames = []
         experiments_found = set()
-        
+        files_by_experiment = defaultdict(set)
+        params_by_experiment = {}
+        source_lines = []
+        preview_lines = []
+
+        # For comprehensive multi-experiment analysis, use strategic excerpts
+        if len(context_docs) > 20:
+            text_length = 600
+        else:
+            text_length = 1000
+
         for doc in context_docs:
-            filename = doc.get("filename", "unknown file")
+            # Read each field once; the display fallbacks below are derived from these values
+            raw_filename = doc.get("filename")
+            raw_experiment_name = doc.get("experiment_name")
             text = doc.get("text", "")
-            experiment_name = doc.get("experiment_name", "")
             experiment_params = doc.get("experiment_params", "")
-            
+            filename = raw_filename or "unknown file"
+            experiment_name = raw_experiment_name or ""
+
+            # Per-experiment file listing and sources, used when several experiments are present
+            exp_key = raw_experiment_name or "Unknown"
+            file_key = raw_filename or "unknown"
+            if exp_key not in params_by_experiment:
+                params_by_experiment[exp_key] = experiment_params
+            files_by_experiment[exp_key].add(file_key)
+            source_lines.append(f"- {exp_key}/{file_key}")
+            preview_lines.append(text[:100] + "...")
+
             if text:
                 if experiment_name:
                     # Multi-experiment context
                     experiments_found.add(experiment_name)
-                    # For comprehensive multi-experiment analysis, use strategic excerpts
-                    if len(context_docs) > 50:
-                        # Many documents - use very short excerpts but include key data
-                        text_length = 400
-                    elif len(context_docs) > 20:
-                        text_length = 600
-                    else:
-                        text_length = 1000
-                    
+
                     # Extract key statistics if it's a CSV file
-                    excerpt = text[:text_length]
-                    if filename.endswith('.csv') and '\n' in text:
-                        lines = text.split('\n')
-                        if len(lines) > 10:
-                            # For CSV files, include header + first few rows + last few rows
-                            excerpt = '\n'.join(lines[:5] + ['...'] + lines[-3:])
+                    excerpt = None
+                    if filename.endswith('.csv'):
+                        # For CSV files, include header + first few rows + last few rows
+                        excerpt = _csv_head_tail(text)
+                    if excerpt is None:
+                        excerpt = text[:text_length]
                     
                     contexts.append(f"From {experiment_name} - {filename} (Parameters: {experiment_params}):\n{excerpt}...")
                 else:
@@ -128,140 +409,115 @@ def generate_response(query, run_dir=None):
         # Detect if this is a multi-experiment analysis
         is_multi_experiment = len(experiments_found) > 1
         
+        # Don't claim full coverage when MAX_CONTEXT_DOCS dropped documents
+        if is_capped:
+            scope = {"num_files": len(context_docs), "total_files": total_docs}
+            data_access_multi = _MULTI_DATA_ACCESS_CAPPED.format(**scope)
+            data_access_single = _SINGLE_DATA_ACCESS_CAPPED.format(**scope)
+            coverage_multi = coverage_single = _COVERAGE_CAPPED.format(**scope)
+            completeness = "SELECTED"
+            retrieved = f"Retrieved the {len(context_docs)} most relevant of {total_docs} documents"
+        else:
+            data_access_multi, data_access_single = _MULTI_DATA_ACCESS_ALL, _SINGLE_DATA_ACCESS_ALL
+            coverage_multi, coverage_single = _MULTI_COVERAGE_ALL, _SINGLE_COVERAGE_ALL
+            completeness = "COMPLETE"
+            retrieved = f"Retrieved ALL {len(context_docs)} documents"
+        
         # Build the RAG prompt with framework context
         if is_multi_experiment:
-            # Create a comprehensive summary of all available data
-            files_by_experiment = {}
-            params_by_experiment = {}
-            
-            for doc in context_docs:
-                exp_name = doc.get("experiment_name", "Unknown")
-                filename = doc.get("filename", "unknown")
-                params = doc.get("experiment_params", "")
-                
-                if exp_name not in files_by_experiment:
-                    files_by_experiment[exp_name] = set()
-                    params_by_experiment[exp_name] = params
-                files_by_experiment[exp_name].add(filename)
-            
             # Create experiment summary
             experiment_summary = []
             for exp_name, files in files_by_experiment.items():
                 params = params_by_experiment.get(exp_name, "")
                 experiment_summary.append(f"**{exp_name}** (Parameters: {params}): {len(files)} files - {', '.join(sorted(files))}")
             
-            prompt = f"""You are an AI assistant performing COMPREHENSIVE COMPARATIVE ANALYSIS across multiple network simulation experiments.
-
-IMPORTANT: You have access to ALL simulation data from ALL selected experiments. Use this complete dataset to provide thorough comparative analysis.
-
-**ANALYSIS SCOPE:**
-- {len(experiments_found)} different experiments: {', '.join(experiments_found)}
-- {len(context_docs)} total data files analyzed
-- Complete data coverage for accurate comparison
-
-**EXPERIMENT DETAILS:**
-{chr(10).join(experiment_summary)}
-
-**ANALYSIS INSTRUCTIONS:**
-- Compare data across ALL experiments
-- Identify patterns, differences, and performance metrics
-- For "which performed best" questions, analyze all relevant metrics and provide rankings
-- Extract specific numbers and statistics from the data
-- Clearly identify which experiment each data point comes from
-
-## FloodNS Framework Concepts:
-{FRAMEWORK_CONTEXT}
-
-## COMPLETE Multi-Experiment Dataset ({len(context_docs)} files):
-{context_string}
-
-**User Question:** {query}
-
-**Provide comprehensive comparative analysis based on ALL available simulation data:**"""
+            prompt = "".join([
+                _MULTI_PROMPT_HEADER_TMPL.format(
+                    data_access=data_access_multi,
+                    num_experiments=len(experiments_found),
+                    experiment_names=', '.join(experiments_found),
+                    num_files=len(context_docs),
+                    coverage=coverage_multi,
+                    experiment_summary=chr(10).join(experiment_summary)
+                ),
+                _MULTI_PROMPT_FRAMEWORK,
+                _MULTI_PROMPT_DATASET_TMPL.format(completeness=completeness, num_files=len(context_docs)),
+                context_string,
+                _MULTI_PROMPT_QUESTION_TMPL.format(query=query)
+            ])
         else:
-            prompt = f"""You are an AI assistant performing COMPREHENSIVE ANALYSIS of network simulation data.
-
-IMPORTANT: You have access to ALL simulation files from this experiment. Use this complete dataset to provide thorough analysis.
-
-**ANALYSIS SCOPE:**
-- {len(context_docs)} total data files analyzed
-- Complete data coverage for accurate analysis
-
-**ANALYSIS INSTRUCTIONS:**
-- Analyze ALL available data files for comprehensive insights
-- Extract specific numbers, statistics and factual information from the provided data
-- If the data contains CSV content, analyze the structure and count unique entries if needed
-- For node counts, count unique node IDs. For bandwidth questions, look for numerical values
-- Provide detailed analysis based on ALL available simulation data
-
-## FloodNS Framework Concepts:
-{FRAMEWORK_CONTEXT}
-
-## COMPLETE Single-Experiment Dataset ({len(context_docs)} files):
-{context_string}
-
-**User Question:** {query}
-
-**Provide comprehensive analysis based on ALL available simulation data:**"""
+            prompt = "".join([
+                _SINGLE_PROMPT_HEADER_TMPL.format(
+                    data_access=data_access_single,
+                    num_files=len(context_docs),
+                    coverage=coverage_single
+                ),
+                _SINGLE_PROMPT_FRAMEWORK,
+                _SINGLE_PROMPT_DATASET_TMPL.format(completeness=completeness, num_files=len(context_docs)),
+                context_string,
+                _SINGLE_PROMPT_QUESTION_TMPL.format(query=query)
+            ])
         
         try:
             # Check whether to use local Ollama model or HuggingFace API
             use_local = os.getenv("USE_LOCAL_MODEL", "false").lower() == "true"
             
+            # Failures raise here and fall through to the parser below, so they are never cached
             if use_local:
-                response = generate_with_ollama(prompt)
+                response = _ollama_generate(prompt, on_token=on_token)
             else:
-                response = generate_with_api(prompt, context_docs, query)
+                response = _api_generate(prompt, on_token=on_token)
                 
             # Add reasoning block after the main answer
             if is_multi_experiment:
-                context_summary = "\n".join([f"- {doc.get('experiment_name', 'Unknown')}/{doc.get('filename', 'unknown')}" for doc in context_docs])
+                context_summary = "\n".join(source_lines)
                 sources_info = f"""
-Retrieved ALL {len(context_docs)} documents from {len(experiments_found)} experiments ({', '.join(experiments_found)}):
+{retrieved} from {len(experiments_found)} experiments ({', '.join(experiments_found)}):
 {context_summary}
 """
                 # Return final response with only sources for multi-experiment (no generic reasoning)
-                return f"{response}\n\n<sources>\n{sources_info}\n</sources>"
+                final_response = f"{response}\n\n<sources>\n{sources_info}\n</sources>"
             else:
                 context_summary = "\n".join([f"- {filename}" for filename in filenames])
-                context_preview = "\n".join([doc.get("text", "")[:100] + "..." for doc in context_docs])
+                context_preview = "\n".join(preview_lines)
                 
                 sources_info = f"""
-Retrieved ALL {len(context_docs)} documents from single experiment:
+{retrieved} from single experiment:
 {context_summary}
 
 Used context:
 {context_preview}
 """
                 # Return final response with only sources for single experiment (no generic reasoning)
-                return f"{response}\n\n<sources>\n{sources_info}\n</sources>"
+                final_response = f"{response}\n\n<sources>\n{sources_info}\n</sources>"
+            
+            QUERY_CACHE.set(cache_key, final_response)
+            return final_response
                 
         except Exception as e:
             error_msg = str(e)
-            return fallback_parser(query, context_docs)
+            return fallback_parser(query, context_docs, query_lower)
     except Exception as e:
         return f"I had trouble searching through the simulation data. Please try again or ask an administrator to check the vector search configuration."
 
 
-def is_bandwidth_query(query):
+def is_bandwidth_query(query, query_lower=None):
     """
     Detect if the query is asking about bandwidth analysis.
     
     This function checks if the query contains keywords related to bandwidth,
-    specifically with the flow_bandwidth.csv file.
+    specifically with the flow_bandwidth.csv file. Callers that already hold
+    the lowercased query can pass it as `query_lower`.
     """
-    query_lower = query.lower()
+    if query_lower is None:
+        query_lower = query.lower()
     
     # Check for bandwidth keywords in combination with file references
-    bandwidth_keywords = ['bandwidth', 'throughput', 'speed', 'data rate']
-    file_keywords = ['flow', 'flow_bandwidth', 'flow bandwidth', 'flow_bandwidth.csv']
-    
-    bandwidth_match = any(kw in query_lower for kw in bandwidth_keywords)
-    file_match = any(kw in query_lower for kw in file_keywords)
+    bandwidth_match = BANDWIDTH_PATTERN.search(query_lower) is not None
+    file_match = FILE_PATTERN.search(query_lower) is not None
     
     # Check if the query is asking about averages, statistics, etc.
-    stat_keywords = ['average', 'avg', 'mean', 'statistics', 'calculate', 'median', 'min', 'max']
-    stat_match = any(kw in query_lower for kw in stat_keywords)
+    stat_match = STAT_PATTERN.search(query_lower) is not None
     
     # Return true if it's likely a bandwidth query
     return (bandwidth_match and (file_match or stat_match)) or (file_match and stat_match)
@@ -317,26 +573,90 @@ def generate_response_with_reasoning(query):
         return f"I had trouble applying step-by-step reasoning to your question. Error: {str(e)}"
 
 
+_LOCAL_MODEL = None
+_LOCAL_TOKENIZER = None
+# FRAMEWORK_CONTEXT tokenized once, since it is embedded in most prompts
+_FRAMEWORK_IDS = None
+_LOCAL_MODEL_LOCK = threading.Lock()
+
+
+def _get_local_model():
+    """Load the local tokenizer and model once per process and reuse them afterwards"""
+    global _LOCAL_MODEL, _LOCAL_TOKENIZER, _FRAMEWORK_IDS
+    with _LOCAL_MODEL_LOCK:
+        if _LOCAL_MODEL is None:
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, trust_remote_code=True)
+
+            # Try to use GPU if available, otherwise use CPU
+            quantization_config = None
+            if torch.cuda.is_available():
+                device_map = "auto"
+                # bf16 keeps fp32's range at half the memory on Ampere and newer
+                dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                # 4-bit NF4 weights cut memory traffic during decoding (needs bitsandbytes, GPU only)
+                if importlib.util.find_spec("bitsandbytes") is not None:
+                    quantization_config = BitsAndBytesConfig(
+                        load_in_4bit=True,
+                        bnb_4bit_compute_dtype=dtype,
+                        bnb_4bit_quant_type="nf4"
+                    )
+            else:
+                device_map = {"": "cpu"}
+                dtype = torch.float32
+
+            _LOCAL_MODEL = AutoModelForCausalLM.from_pretrained(
+                MODEL_NAME,
+                trust_remote_code=True,
+                device_map=device_map,
+                torch_dtype=dtype,
+                quantization_config=quantization_config
+            )
+            _FRAMEWORK_IDS = tokenizer(FRAMEWORK_CONTEXT, add_special_tokens=False, return_tensors="pt").input_ids
+            _LOCAL_TOKENIZER = tokenizer
+    return _LOCAL_TOKENIZER, _LOCAL_MODEL
+
+
+def _encode_prompt(tokenizer, prompt):
+    """Tokenize a prompt, splicing in the cached framework token ids when the framework text is embedded"""
+    start = prompt.find(FRAMEWORK_CONTEXT)
+    if _FRAMEWORK_IDS is None or start == -1:
+        return tokenizer(prompt, return_tensors="pt").input_ids
+    end = start + len(FRAMEWORK_CONTEXT)
+    prefix_ids = tokenizer(prompt[:start], return_tensors="pt").input_ids
+    suffix_ids = tokenizer(prompt[end:], add_special_tokens=False, return_tensors="pt").input_ids
+    return torch.cat([prefix_ids, _FRAMEWORK_IDS, suffix_ids], dim=1)
+
+
+def _server_generate(prompt):
+    """Generate through the OpenAI-compatible completions endpoint at LOCAL_LLM_SERVER_URL"""
+    response = _LOCAL_LLM_SESSION.post(
+        f"{LOCAL_LLM_SERVER_URL.rstrip('/')}/completions",
+        timeout=LOCAL_LLM_TIMEOUT,
+        headers={"Content-Type": "application/json"},
+        data=orjson.dumps({
+            "model": MODEL_NAME,
+            "prompt": prompt,
+            "max_tokens": 150,
+            "temperature": 0
+        })
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)["choices"][0]["text"].strip()
+
+
 def generate_with_local_model(prompt):
     """Generate text using a local DeepSeek model if available"""
     try:
-        # Load model and tokenizer
-        model_name = os.getenv("MODEL_NAME")
-        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-        
-        # Try to use GPU if available, otherwise use CPU
-        device_map = "auto" if torch.cuda.is_available() else {"": "cpu"}
-        dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+        # A batching inference server shares the GPU across concurrent queries,
+        # so prefer it over loading the model into this process
+        if LOCAL_LLM_SERVER_URL:
+            return _server_generate(prompt)
         
-        model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            trust_remote_code=True,
-            device_map=device_map,
-            torch_dtype=dtype
-        )
+        # Load model and tokenizer (cached after the first call)
+        tokenizer, model = _get_local_model()
         
         # Generate response
-        input_ids = tokenizer(prompt, return_tensors="pt").input_ids
+        input_ids = _encode_prompt(tokenizer, prompt)
         
         # Move input to correct device
         if torch.cuda.is_available():
@@ -347,45 +667,71 @@ def generate_with_local_model(prompt):
             output = model.generate(
                 input_ids,
                 max_new_tokens=150,
-                temperature=0.7,
-                do_sample=True,
+                do_sample=False,
+                num_beams=1,
+                use_cache=True,
                 pad_token_id=tokenizer.eos_token_id
             )
         
-        # Decode and return the response
-        response = tokenizer.decode(output[0], skip_special_tokens=True)
-        
-        # Extract only the answer part after the prompt
-        answer = response[len(prompt):]
+        # Decode only the generated tokens, i.e. the answer part after the prompt
+        answer = tokenizer.decode(output[0][input_ids.shape[1]:], skip_special_tokens=True)
         return answer.strip()
     
     except Exception as e:
         return generate_with_api(prompt)
 
-def generate_with_api(prompt, context_docs=None, query=None):
-    """Generate text using the Hugging Face Inference API"""
-    try:        
-        # Initialize the client
-        hf_token = os.getenv("HF_TOKEN")
-        model_name = os.getenv("MODEL_NAME")
-        if not hf_token:
-            client = InferenceClient()
-        else:
-            client = InferenceClient(token=hf_token)
-        
-        # Generate response using the API
-        response = client.text_generation(
+@lru_cache(maxsize=4)
+def _hf_client(token):
+    """Return a shared Hugging Face InferenceClient for the given token"""
+    return InferenceClient(token=token) if token else InferenceClient()
+
+
+def _api_generate(prompt, on_token=None):
+    """
+    Call the Hugging Face Inference API, raising on failure.
+
+    If `on_token` is given, tokens are streamed to it as they are generated;
+    the full text is still returned.
+    """
+    return _cached_generation(MODEL_NAME, prompt, lambda: _api_request(prompt, on_token), on_token, API_TEMPERATURE)
+
+
+def _api_request(prompt, on_token=None):
+    # Reuse the client for this token instead of building one per call
+    client = _hf_client(os.getenv("HF_TOKEN"))
+    
+    if on_token is not None:
+        chunks = []
+        for token in client.text_generation(
             prompt=prompt,
-            model=model_name,
+            model=MODEL_NAME,
             max_new_tokens=150,
-            temperature=0.7,
-            repetition_penalty=1.1
-        )
-        
-        # Extract the answer part (remove the prompt)
-        answer = response[len(prompt):] if len(response) > len(prompt) else response
-        return answer.strip()
-        
+            temperature=API_TEMPERATURE,
+            repetition_penalty=1.1,
+            stream=True
+        ):
+            chunks.append(token)
+            on_token(token)
+        return "".join(chunks).strip()
+    
+    # Generate response using the API
+    response = client.text_generation(
+        prompt=prompt,
+        model=MODEL_NAME,
+        max_new_tokens=150,
+        temperature=API_TEMPERATURE,
+        repetition_penalty=1.1
+    )
+    
+    # Extract the answer part (remove the prompt)
+    answer = response[len(prompt):] if len(response) > len(prompt) else response
+    return answer.strip()
+
+
+def generate_with_api(prompt, context_docs=None, query=None):
+    """Generate text using the Hugging Face Inference API"""
+    try:
+        return _api_generate(prompt)
     except Exception as e:
         # Use the fallback parser if context and query are available
         if context_docs and query:
@@ -394,9 +740,33 @@ def generate_with_api(prompt, context_docs=None, query=None):
         # Manual fallback - extract information from retrieved documents to provide a basic answer
         return "I'm sorry, I couldn't access the language model service. Please try again later."
 
-def fallback_parser(query, context_docs):
+
+def generate_with_api_batch(prompts, max_workers=8):
+    """
+    Generate responses for several prompts concurrently through the Hugging Face API.
+
+    The calls are network-bound, so threads overlap their latency. Results are
+    returned in the same order as `prompts`.
+    """
+    prompts = list(prompts)
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts))) as executor:
+        return list(executor.map(generate_with_api, prompts))
+
+
+def _read_csv_table(text):
+    """Parse headerless CSV text into an Arrow table"""
+    return pacsv.read_csv(
+        pa.py_buffer(text.encode("utf-8")),
+        read_options=pacsv.ReadOptions(autogenerate_column_names=True),
+    )
+
+
+def fallback_parser(query, context_docs, query_lower=None):
     """Directly parse the simulation data when the API is unavailable"""
-    query_lower = query.lower()
+    if query_lower is None:
+        query_lower = query.lower()
     
     # Check if this is multi-experiment data
     experiments_found = set()
@@ -416,9 +786,9 @@ def fallback_parser(query, context_docs):
                 if text:
                     try:
                         # Parse CSV content
-                        df = pd.read_csv(io.StringIO(text), header=None)
+                        table = _read_csv_table(text)
                         # First column typically contains node IDs
-                        node_count = df[0].nunique()
+                        node_count = pc.count_distinct(table.column(0)).as_py()
                         return f"Based on the node_info.csv file, there are {node_count} unique nodes in the simulation."
                     except Exception as e:
                         # Try a basic line count approach
@@ -433,24 +803,26 @@ def fallback_parser(query, context_docs):
                 if text:
                     try:
                         # Try to parse the CSV
-                        df = pd.read_csv(io.StringIO(text), header=None)
+                        table = _read_csv_table(text)
                         # Look for columns that might contain bandwidth values
                         # Typically the last column in bandwidth files
-                        last_col = df.columns[-1]
-                        # Convert to numeric, ignoring errors
-                        bandwidth_values = pd.to_numeric(df[last_col], errors='coerce')
-                        # Calculate average of non-NaN values
-                        avg_bandwidth = bandwidth_values.mean()
+                        bandwidth_values = table.column(table.num_columns - 1).cast(pa.float64(), safe=False)
+                        # Calculate average of non-null values
+                        avg_bandwidth = pc.mean(bandwidth_values).as_py()
+                        if avg_bandwidth is None:
+                            raise ValueError("No numeric bandwidth values found")
                         return f"Based on {doc.get('filename')}, the average bandwidth is approximately {avg_bandwidth:.2f}."
                     except Exception as e:
                         # Try a simpler approach with regex
                         pass
-                        numbers = re.findall(r'[\d.]+', text)
+                        numbers = NUMBER_PATTERN.findall(text)
                         if numbers:
                             try:
-                                values = [float(num) for num in numbers if float(num) > 0]
-                                if values:
-                                    avg = sum(values) / len(values)
+                                # Parse and filter in one vectorized pass
+                                values = np.array(numbers).astype(np.float64)
+                                values = values[values > 0]
+                                if values.size:
+                                    avg = values.mean()
                                     return f"Based on {doc.get('filename')}, the average bandwidth is approximately {avg:.2f}."
                             except:
                                 pass
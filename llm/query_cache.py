@@ -0,0 +1,149 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with a time-to-live for generated chat responses.
+
+    Entries older than `ttl` seconds are treated as missing, and the least
+    recently used entry is evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a stable cache key from arbitrary (repr-able) parts"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(repr(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting the least recently used entries if needed"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "size": len(self._entries),
+            }
+
+
+class DiskResponseCache:
+    """
+    SQLite-backed store of model responses keyed by (model, prompt).
+
+    Survives process restarts so unchanged prompts don't hit the LLM again.
+    Entries older than `ttl` seconds are treated as missing and purged when the
+    database is opened. Empty responses are never stored.
+    Storage errors are swallowed: a broken cache only means a cache miss.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            with self._conn:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        return self._conn
+
+    def get(self, key):
+        """Return the stored response for `key`, or None if it is missing, empty or expired"""
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row or not row[0] or row[1] < time.time() - self.ttl:
+            return None
+        return row[0]
+
+    def set(self, key, response):
+        """Store `response` under `key`, replacing any previous value; empty responses are skipped"""
+        if not response:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                        (key, response, time.time()),
+                    )
+        except sqlite3.Error:
+            pass
+
+
+def context_signature(context_docs):
+    """
+    Hash identifying the set of retrieved documents a response was built from.
+
+    A change in the retrieved files (or their contents' length) yields a new
+    signature, which invalidates any answers cached for the old documents.
+    """
+    items = sorted(
+        (doc.get("experiment_name", ""), doc.get("filename", ""), len(doc.get("text", "")))
+        for doc in context_docs
+    )
+    return hashlib.sha256(repr(items).encode("utf-8")).hexdigest()
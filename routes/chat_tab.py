@@ -57,7 +57,12 @@ def parse_sources_tags(text):
     
     return text, None
 
+@st.fragment
 def render_chat_tab(simulation_id, experiment):
+    """
+    Renders the single-experiment chat. Runs as a fragment so chat interactions rerun only this
+    tab rather than the whole details page.
+    """
     st.title("Chat with Your Simulation Data")
     
     # Add a link back to dashboard
@@ -77,7 +82,7 @@ def render_chat_tab(simulation_id, experiment):
                     if clear_chat_history(simulation_id):
                         st.success("Chat history cleared successfully!")
                         st.session_state.chat_history = []
-                        st.rerun()
+                        st.rerun(scope="fragment")
                     else:
                         st.error("Failed to clear chat history")
         
@@ -150,7 +155,7 @@ def render_chat_tab(simulation_id, experiment):
                     # Add close button
                     if st.button("❌ Hide Reasoning", key=f"hide_thinking_{idx}"):
                         st.session_state[f"thinking_content_{idx}"] = None
-                        st.rerun()
+                        st.rerun(scope="fragment")
             
             # Show sources content if button was clicked
             if st.session_state.get(f"sources_content_{idx}"):
@@ -168,24 +173,35 @@ def render_chat_tab(simulation_id, experiment):
                     # Add close button
                     if st.button("❌ Hide Sources", key=f"hide_sources_{idx}"):
                         st.session_state[f"sources_content_{idx}"] = None
-                        st.rerun()
+                        st.rerun(scope="fragment")
 
     # Input only if you can chat
     if "files_ingested" in st.session_state and st.session_state.files_ingested:
         user_question = st.chat_input("Ask about your simulation data...")
 
         if user_question:
-            # Generate a response
-            with st.spinner("Analyzing simulation data..."):
-                try:
-                    answer = generate_response(user_question, run_dir=experiment.get("run_dir"))
-                except Exception as e:
-                    answer = f"Error generating response: {str(e)}"
+            with st.chat_message("user"):
+                st.markdown(user_question)
+
+            # Generate a response, rendering the answer as it streams in
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                streamed = []
+
+                def show_token(token):
+                    streamed.append(token)
+                    placeholder.markdown("".join(streamed))
+
+                with st.spinner("Analyzing simulation data..."):
+                    try:
+                        answer = generate_response(user_question, run_dir=experiment.get("run_dir"), on_token=show_token)
+                    except Exception as e:
+                        answer = f"Error generating response: {str(e)}"
             
             # Save the answer to history and to the database
             st.session_state.chat_history.append((user_question, answer))
             save_chat_message(simulation_id, user_question, answer)
-            st.rerun()
+            st.rerun(scope="fragment")
     else:
         st.warning("Chat is only available for finished experiments with processed output files. Please ensure your experiment is complete and the data has been processed successfully.")
         if experiment and experiment.get("state") == "Finished" and experiment.get("run_dir"):
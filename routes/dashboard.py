@@ -75,6 +75,7 @@ def stop_experiment(simulation_id):
                 "$set": {
                     "state": "Finished",
                     "end_time": datetime.now().isoformat(),
+                    "output_files": None,
                 }
             }
         )
@@ -113,7 +114,7 @@ def update_experiment_status(simulation_id, new_state="Finished"):
     try:
         experiments_collection.update_one(
             {"_id": ObjectId(simulation_id)},
-            {"$set": {"state": new_state, "end_time": datetime.now().isoformat()}}
+            {"$set": {"state": new_state, "end_time": datetime.now().isoformat(), "output_files": None}}
         )
         st.success(f"Experiment {simulation_id} marked as {new_state}.")
     except Exception as e:
@@ -184,7 +185,8 @@ def save_edited_simulation(simulation_id, simulation_name, params):
                     "simulation_name": simulation_name,
                     "params": params,
                     "state": "Edited",
-                    "end_time": None
+                    "end_time": None,
+                    "output_files": None
                 }
             }
         )
@@ -337,7 +339,8 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
             {"_id": ObjectId(simulation_id)},
             {
                 "$set": {
-                    "run_dir": relative_run_dir
+                    "run_dir": relative_run_dir,
+                    "output_files": None
                 }
             }
         )
@@ -351,7 +354,7 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
         # Update the experiment state to error
         experiments_collection.update_one(
             {"_id": simulation_id},
-            {"$set": {"state": "Error", "error_message": str(e)}}
+            {"$set": {"state": "Error", "error_message": str(e), "output_files": None}}
         )
     
 def re_run_simulation(simulation_id):
@@ -387,6 +390,7 @@ def re_run_simulation(simulation_id):
                     "start_time": datetime.now().isoformat(),
                     "end_time": None,
                     "run_dir": None,
+                    "output_files": None,
                 }
             }
         )
@@ -1,18 +1,17 @@
 from llm.generate import generate_response
 import streamlit as st
 from streamlit_js_eval import streamlit_js_eval
-import pandas as pd
 from datetime import datetime
-from pymongo import MongoClient
-from bson import ObjectId
+from functools import partial
+from pymongo import MongoClient, ReturnDocument
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import streamlit.components.v1 as components
 
 from routes.chat_utils import ingest_experiment_data
 from routes.chat_tab import render_chat_tab
-from floodns.external.simulation.main import local_run_single_job, local_run_multiple_jobs, local_run_multiple_jobs_different_ring_size
-from floodns.external.schemas.routing import Routing
-from db_client import experiments_collection
+from db_client import experiments_collection, object_id
 from llm.retrieval import setup_vector_search_index
 from llm.ingest import process_simulation_output
 from conf import FLOODNS_ROOT
@@ -24,11 +23,59 @@ from routes.valid_options import (
 
 
 
+# Fields the details page actually renders; large ones such as chat_history are left on the server
+EXPERIMENT_DETAIL_PROJECTION = {
+    "simulation_name": 1,
+    "date": 1,
+    "start_time": 1,
+    "end_time": 1,
+    "state": 1,
+    "run_dir": 1,
+    "params": 1,
+    "output_files": 1,
+}
+
+# CSV logs the simulator writes into run_dir
+OUTPUT_FILENAMES = [
+    "flow_bandwidth.csv",
+    "flow_info.csv",
+    "link_info.csv",
+    "link_num_active_flows.csv",
+    "link_utilization.csv",
+    "node_info.csv",
+    "node_num_active_flows.csv",
+    "connection_bandwidth.csv",
+    "connection_info.csv"
+]
+
+
+# Display labels for the comma-separated "params" string, in order
+PARAMS_COLUMNS = ("Num Jobs", "Num Cores", "Ring Size", "Routing Algorithm", "Seed", "Model")
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_experiment_cached(simulation_id):
+    """
+    Fetch an experiment document, memoized across reruns.
+
+    Callers that modify the experiment must call _fetch_experiment_cached.clear().
+    """
+    experiment = experiments_collection.find_one(
+        {"_id": object_id(simulation_id)}, projection=EXPERIMENT_DETAIL_PROJECTION
+    )
+    if experiment:
+        experiment['_id'] = str(experiment['_id'])  # Convert ObjectId to string
+        # Parse the params string once here rather than on every rerun
+        params_array = experiment.get("params", "").split(",")
+        experiment["params_array"] = params_array
+        experiment["params_dict"] = dict(zip(PARAMS_COLUMNS, params_array))
+    return experiment
+
+
 def fetch_experiment_details(simulation_id):
     try:
-        experiment = experiments_collection.find_one({"_id": ObjectId(simulation_id)})
+        experiment = _fetch_experiment_cached(simulation_id)
         if experiment:
-            experiment['_id'] = str(experiment['_id'])  # Convert ObjectId to string
             return experiment
         else:
             st.error("Experiment not found")
@@ -97,16 +144,18 @@ def save_edited_experiment(simulation_id, simulation_name, params):
             return
 
         experiments_collection.update_one(
-            {"_id": ObjectId(simulation_id)},
+            {"_id": object_id(simulation_id)},
             {
                 "$set": {
                     "simulation_name": simulation_name,
                     "params": params,
                     "state": "Edited",
-                    "end_time": None
+                    "end_time": None,
+                    "output_files": None
                 }
             }
         )
+        _fetch_experiment_cached.clear()
         st.success("Simulation updated successfully!")
         st.session_state.edit_experiment_modal = False
         st.rerun()
@@ -116,7 +165,8 @@ def save_edited_experiment(simulation_id, simulation_name, params):
 
 def delete_experiment(simulation_id):
     try:
-        experiments_collection.delete_one({"_id": ObjectId(simulation_id)})
+        experiments_collection.delete_one({"_id": object_id(simulation_id)})
+        _fetch_experiment_cached.clear()
         st.session_state.experiment = None
         st.success("Experiment deleted successfully!")
         st.session_state.delete_success = True
@@ -124,23 +174,88 @@ def delete_experiment(simulation_id):
     except Exception as e:
         st.error(f"Error deleting experiment: {e}")
         
-def render_output_files(run_dir, filenames):
+# Files above this size are read per rerun instead of being held in the process-wide cache
+MAX_CACHED_OUTPUT_BYTES = 16 * 1024 * 1024
+
+
+@st.cache_resource(max_entries=16, ttl=600, show_spinner=False)
+def _read_output_file_cached(file_path, mtime_ns, size):
+    """
+    Read an output file's bytes, memoized on (path, mtime, size) so reruns skip the disk read
+    until the simulation rewrites the file. Uses cache_resource so hits hand back the same
+    immutable bytes object instead of unpickling a fresh copy on every rerun.
+    """
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+def _read_output_file(file_path, mtime_ns, size):
+    """
+    Return an output file's bytes, caching only files up to MAX_CACHED_OUTPUT_BYTES so large
+    logs such as flow_bandwidth.csv are not pinned in memory across sessions.
+    """
+    if size > MAX_CACHED_OUTPUT_BYTES:
+        with open(file_path, "rb") as file:
+            return file.read()
+    return _read_output_file_cached(file_path, mtime_ns, size)
+
+
+def _scan_output_files(run_dir, filenames):
+    """
+    List run_dir once with os.scandir and return {filename: (mtime_ns, size)} for the wanted files
+    that exist, instead of probing each path with os.path.exists.
+
+    Each file is stat'ed on every call: a re-run with the same parameters overwrites the CSVs in
+    place, which leaves the directory's own mtime unchanged.
+    """
+    wanted = set(filenames)
+    found = {}
+    try:
+        with os.scandir(run_dir) as entries:
+            for entry in entries:
+                if entry.name in wanted and entry.is_file():
+                    stat = entry.stat()
+                    found[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        pass
+    return found
+
+
+def _output_files_listing(run_dir):
+    """
+    Snapshot of the output CSVs in run_dir as stored in the experiment's "output_files" field.
+
+    Every write that changes an experiment's state or run_dir must reset that field, because
+    render_output_files trusts it without touching the disk.
+    """
+    if not os.path.isabs(run_dir):
+        run_dir = os.path.join(FLOODNS_ROOT, run_dir)
+    return [
+        {"name": name, "mtime_ns": mtime_ns, "size": size}
+        for name, (mtime_ns, size) in _scan_output_files(run_dir, OUTPUT_FILENAMES).items()
+    ]
+
+
+def render_output_files(run_dir, filenames, output_files=None):
     """
     Renders links to download output files from the simulation.
+
+    output_files is the listing recorded on the experiment when it finished; when present the
+    directory is not scanned at all.
     """
     # If run_dir is a relative path, convert it to absolute using FLOODNS_ROOT
     if not os.path.isabs(run_dir):
         run_dir = os.path.join(FLOODNS_ROOT, run_dir)
         
     # Check if any files exist
-    files_exist = False
-    for filename in filenames:
-        file_path = os.path.join(run_dir, filename)
-        if os.path.exists(file_path):
-            files_exist = True
-            break
+    if output_files:
+        existing_files = {
+            f["name"]: (f["mtime_ns"], f["size"]) for f in output_files if f["name"] in filenames
+        }
+    else:
+        existing_files = _scan_output_files(run_dir, filenames)
     
-    if not files_exist:
+    if not existing_files:
         st.write("No output files found for this experiment.")
         return
     
@@ -156,18 +271,18 @@ def render_output_files(run_dir, filenames):
     # Display each file as a download button
     for filename in filenames:
         file_path = os.path.join(run_dir, filename)
-        if os.path.exists(file_path):
+        file_stat = existing_files.get(filename)
+        if file_stat is not None:
             try:
-                # Read the file and create a download button
-                with open(file_path, "rb") as file:
-                    file_data = file.read()
-                    col = col1 if use_col1 else col2
-                    col.download_button(
-                        label=filename,
-                        data=file_data,
-                        file_name=filename,
-                        mime="text/csv"
-                    )
+                # Read the file (cached until it changes) and create a download button
+                file_data = _read_output_file(file_path, *file_stat)
+                col = col1 if use_col1 else col2
+                col.download_button(
+                    label=filename,
+                    data=file_data,
+                    file_name=filename,
+                    mime="text/csv"
+                )
                 # Toggle column for next file
                 use_col1 = not use_col1
             except Exception as e:
@@ -202,38 +317,82 @@ def check_experiment_status(run_dir):
         st.error(f"Error checking experiment status file {status_file_path}: {e}")
         return False
     
+@st.cache_resource
+def _rerun_pool():
+    """
+    Bounded pool for re-runs plus the map of in-flight futures, shared by every session and rerun
+    so repeated clicks cannot spawn unbounded threads or launch the same experiment twice.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(2, (os.cpu_count() or 2) // 2), thread_name_prefix="rerun")
+    return executor, {}, threading.Lock()
+
+def _submit_rerun(simulation_id, start):
+    """
+    Reserves the re-run slot for this experiment, calls start() to mark it as running and fetch
+    the run parameters, then hands run_simulation to the re-run pool.
+    Returns False, without calling start(), when a re-run is already in flight.
+    """
+    executor, pending, lock = _rerun_pool()
+    reservation = Future()
+    with lock:
+        future = pending.get(simulation_id)
+        if future is not None and not future.done():
+            return False
+        pending[simulation_id] = reservation
+
+    def run_in_background(args):
+        try:
+            run_simulation(simulation_id, *args)
+        finally:
+            with lock:
+                pending.pop(simulation_id, None)
+
+    try:
+        args = start()
+        with lock:
+            pending[simulation_id] = executor.submit(run_in_background, args)
+    except BaseException:
+        with lock:
+            pending.pop(simulation_id, None)
+        raise
+    return True
+
+def _mark_rerun_started(simulation_id):
+    """
+    Flips the experiment to "Running" and returns its parameters, in a single round-trip.
+    """
+    experiment = experiments_collection.find_one_and_update(
+        {"_id": object_id(simulation_id)},
+        {
+            "$set": {
+                "state": "Running",
+                "start_time": datetime.now().isoformat(),
+                "end_time": None,
+                "run_dir": None,
+                "output_files": None,
+            }
+        },
+        projection={"params": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    _fetch_experiment_cached.clear()
+    if not experiment:
+        raise LookupError("Experiment not found for re-run.")
+
+    # Extract parameters from the experiment
+    num_jobs, num_cores, ring_size, routing, seed, model = experiment["params"].split(",")
+    return num_jobs, num_cores, ring_size, routing, seed, model
+
 def re_run_experiment(simulation_id):
     """
     Re-runs the simulation based on the parameters provided.
     """
     try:
-        # Fetch the experiment details
-        experiment = experiments_collection.find_one({"_id": ObjectId(simulation_id)})
-        if not experiment:
-            st.error("Experiment not found for re-run.")
+        if not _submit_rerun(simulation_id, lambda: _mark_rerun_started(simulation_id)):
+            st.info("A re-run of this experiment is already in progress.")
             return
 
-        # Extract parameters from the experiment
-        params = experiment["params"]
-        num_jobs, num_cores, ring_size, routing, seed, model = params.split(",")
-
-        # Update the experiment state to "Running"
-        experiments_collection.update_one(
-            {"_id": ObjectId(simulation_id)},
-            {
-                "$set": {
-                    "state": "Running",
-                    "start_time": datetime.now().isoformat(),
-                    "end_time": None,
-                    "run_dir": None,
-                }
-            }
-        )
-        
         streamlit_js_eval(js_expressions="parent.window.location.reload()")
-        
-        # Run the simulation
-        run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed, model)
 
     except Exception as e:
         st.error(f"Error re-running simulation: {e}")
@@ -243,15 +402,21 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
     Runs the simulation based on the parameters provided.
     """
     try:
+        # Imported here so pages that never launch a run skip loading the simulator
+        from floodns.external.simulation.main import local_run_single_job, local_run_multiple_jobs, local_run_multiple_jobs_different_ring_size
+        from floodns.external.schemas.routing import Routing
+
         routing_enum = Routing[routing]
 
-        # Determine the appropriate run function and parameters
+        # Determine the appropriate run function and parameters; the run directory is
+        # deterministic, so it can be recorded before the (blocking) simulation starts
         run_dir = None
         ring_size_param = int(ring_size) if ring_size != "different" else ring_size
 
         # Convert ring_size to int if it's not "different"
         if int(num_jobs) == 1:
-            proc = local_run_single_job(
+            launch = partial(
+                local_run_single_job,
                 seed=int(seed),
                 n_core_failures=int(num_cores),
                 ring_size=ring_size_param,
@@ -273,7 +438,8 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
             )
 
         elif int(num_jobs) > 1 and ring_size == "different":
-            proc = local_run_multiple_jobs_different_ring_size(
+            launch = partial(
+                local_run_multiple_jobs_different_ring_size,
                 seed=int(seed),
                 n_jobs=int(num_jobs),
                 n_core_failures=int(num_cores),
@@ -292,7 +458,8 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
             )
 
         else:
-            proc = local_run_multiple_jobs(
+            launch = partial(
+                local_run_multiple_jobs,
                 seed=int(seed),
                 n_jobs=int(num_jobs),
                 ring_size=int(ring_size),
@@ -318,9 +485,15 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
         # Create run_dir if it doesn't exist
         os.makedirs(run_dir, exist_ok=True)
 
-        # Get the logs_floodns path specifically for analysis
-        logs_floodns_dir = os.path.join(run_dir, "logs_floodns")
-        final_run_dir = logs_floodns_dir if os.path.exists(logs_floodns_dir) else run_dir
+        # The simulator writes its logs, including run_finished.txt, into logs_floodns
+        final_run_dir = os.path.join(run_dir, "logs_floodns")
+
+        # Drop the marker a previous run in this directory left behind, so the status poller
+        # does not report the new run finished before the simulator resets it
+        try:
+            os.remove(os.path.join(final_run_dir, "run_finished.txt"))
+        except FileNotFoundError:
+            pass
 
         # Store the relative path instead of the absolute path
         if final_run_dir.startswith(FLOODNS_ROOT):
@@ -330,24 +503,79 @@ def run_simulation(simulation_id, num_jobs, num_cores, ring_size, routing, seed,
             
         # Update the experiment with the relative run_dir
         experiments_collection.update_one(
-            {"_id": ObjectId(simulation_id)},
+            {"_id": object_id(simulation_id)},
             {
                 "$set": {
                     "run_dir": relative_run_dir,
+                    "output_files": None,
                 }
             }
         )
+        _fetch_experiment_cached.clear()
+
+        # Runs on the re-run pool, outside any script run, so report to the server log
+        print(f"Starting simulation {simulation_id}. Run directory: {final_run_dir}")
 
-        st.write(f"Simulation launched! Run directory: {final_run_dir}")
+        # Blocks until the simulation process exits
+        proc = launch()
+        if proc.returncode != 0:
+            raise RuntimeError(f"Simulation exited with code {proc.returncode}")
+
+        # Mark the run finished and record the output listing here, so completion does not
+        # depend on someone having the page open
+        experiments_collection.update_one(
+            {"_id": object_id(simulation_id)},
+            {
+                "$set": {
+                    "state": "Finished",
+                    "end_time": datetime.now().isoformat(),
+                    "output_files": _output_files_listing(final_run_dir),
+                }
+            }
+        )
+        _fetch_experiment_cached.clear()
+        print(f"Simulation {simulation_id} finished. Run directory: {final_run_dir}")
         
 
     except Exception as e:
-        st.error(f"Error starting simulation: {e}")
+        print(f"Error running simulation {simulation_id}: {e}")
         # Update the experiment state to error
         experiments_collection.update_one(
-            {"_id": simulation_id},
-            {"$set": {"state": "Error", "error_message": str(e)}}
+            {"_id": object_id(simulation_id)},
+            {"$set": {"state": "Error", "error_message": str(e), "output_files": None}}
         )
+        _fetch_experiment_cached.clear()
+
+@st.fragment(run_every=5)
+def render_running_status(simulation_id):
+    """
+    Polls a running experiment every few seconds and reruns the page once it leaves "Running".
+    run_simulation records the outcome itself; the run_finished.txt check covers runs launched
+    elsewhere. Only this fragment reruns while polling, and each tick costs one cached,
+    projected fetch plus a single file read.
+    """
+    experiment = _fetch_experiment_cached(simulation_id)
+    if not experiment or experiment.get("state") != "Running":
+        st.rerun()
+
+    run_dir = experiment.get("run_dir")
+    with st.status("Simulation running...", expanded=True) as status:
+        if not run_dir:
+            st.write("Launching simulation...")
+            return
+
+        st.write(f"Simulating in {run_dir}")
+        if check_experiment_status(run_dir):
+            # Record the output listing once so the Finished page never has to scan run_dir
+            output_files = _output_files_listing(run_dir)
+            experiments_collection.update_one(
+                {"_id": object_id(simulation_id)},
+                {"$set": {"state": "Finished", "end_time": datetime.now().isoformat(), "output_files": output_files}}
+            )
+            _fetch_experiment_cached.clear()
+            status.update(label="Experiment completed successfully!", state="complete")
+            st.rerun()
+
 
 def display_page(simulation_id):
     """
@@ -410,16 +638,7 @@ def display_page(simulation_id):
             with col3:
                 st.button("Delete", on_click=lambda: delete_experiment(simulation_id))
             if experiment.get("state") == "Running":
-                    if st.button("🔄"): 
-                        if check_experiment_status(experiment.get("run_dir")):
-                            experiments_collection.update_one(
-                                {"_id": ObjectId(simulation_id)},
-                                {"$set": {"state": "Finished", "end_time": datetime.now().isoformat()}}
-                            )
-                            st.success("Experiment completed successfully!")
-                            st.rerun()
-                        else:
-                            st.warning("Experiment is still running.")
+                render_running_status(simulation_id)
 
             # Handle deletion success
             if st.session_state.get("delete_success", False) and st.session_state.get("delete_simulation_id") == simulation_id:
@@ -430,25 +649,16 @@ def display_page(simulation_id):
                 return
 
             st.subheader("Summary")
-            st.write(f"Date: {experiment['date']}")
-            st.write(f"Start time: {experiment['start_time']}")
-            st.write(f"End time: {experiment['end_time']}")
-            st.write(f"State: {experiment['state']}")
+            st.markdown(
+                f"Date: {experiment['date']}  \n"
+                f"Start time: {experiment['start_time']}  \n"
+                f"End time: {experiment['end_time']}  \n"
+                f"State: {experiment['state']}"
+            )
 
             if experiment.get("state") == "Finished" and experiment.get("run_dir"):
                 st.subheader("Output Files")
-                filenames = [
-                    "flow_bandwidth.csv",
-                    "flow_info.csv",
-                    "link_info.csv",
-                    "link_num_active_flows.csv",
-                    "link_utilization.csv",
-                    "node_info.csv",
-                    "node_num_active_flows.csv",
-                    "connection_bandwidth.csv",
-                    "connection_info.csv"
-                ]
-                render_output_files(experiment["run_dir"], filenames)
+                render_output_files(experiment["run_dir"], OUTPUT_FILENAMES, experiment.get("output_files"))
 
                 # Ingest data for LLM if not already done
                 if "files_ingested" not in st.session_state:
@@ -458,16 +668,8 @@ def display_page(simulation_id):
                 st.write("This experiment does not have a 'run_dir' field or is not finished.")
 
             st.subheader("Parameters")
-            params_array = experiment["params"].split(",")
-            params_dict = {
-                "Num Jobs": params_array[0],
-                "Num Cores": params_array[1],
-                "Ring Size": params_array[2],
-                "Routing Algorithm": params_array[3],
-                "Seed": params_array[4],
-                "Model": params_array[5],
-            }
-            st.write(pd.DataFrame([params_dict]))
+            params_array = experiment["params_array"]
+            st.table([experiment["params_dict"]])
 
             if st.session_state.get("edit_experiment_modal", False):
                 placeholder = st.empty()
@@ -579,6 +781,7 @@ def display_multiple_experiments_page(simulation_ids):
             
             # Display summary table
             st.subheader("Summary Comparison")
+            import pandas as pd
             summary_data = []
             for exp in experiments:
                 params_array = exp["params"].split(",")
@@ -652,35 +855,30 @@ def render_output_files_compact(run_dir, filenames, experiment_name=None):
         run_dir = os.path.join(FLOODNS_ROOT, run_dir)
         
     # Check if any files exist
-    files_exist = False
-    for filename in filenames:
-        file_path = os.path.join(run_dir, filename)
-        if os.path.exists(file_path):
-            files_exist = True
-            break
+    existing_files = _scan_output_files(run_dir, filenames)
     
-    if not files_exist:
+    if not existing_files:
         st.write("No output files found.")
         return
     
     # Display each file as a compact download button
     for filename in filenames:
         file_path = os.path.join(run_dir, filename)
-        if os.path.exists(file_path):
+        file_stat = existing_files.get(filename)
+        if file_stat is not None:
             try:
-                # Read the file and create a download button
-                with open(file_path, "rb") as file:
-                    file_data = file.read()
-                    # Create unique key using experiment name and filename
-                    unique_key = f"download_{experiment_name}_{filename}" if experiment_name else f"download_{filename}_{hash(run_dir)}"
-                    st.download_button(
-                        label=filename,
-                        data=file_data,
-                        file_name=f"{experiment_name}_{filename}" if experiment_name else filename,
-                        mime="text/csv",
-                        use_container_width=True,
-                        key=unique_key
-                    )
+                # Read the file (cached until it changes) and create a download button
+                file_data = _read_output_file(file_path, *file_stat)
+                # Create unique key using experiment name and filename
+                unique_key = f"download_{experiment_name}_{filename}" if experiment_name else f"download_{filename}_{hash(run_dir)}"
+                st.download_button(
+                    label=filename,
+                    data=file_data,
+                    file_name=f"{experiment_name}_{filename}" if experiment_name else filename,
+                    mime="text/csv",
+                    use_container_width=True,
+                    key=unique_key
+                )
             except Exception as e:
                 st.error(f"Error reading file {filename}: {e}")
 
@@ -770,7 +968,7 @@ def ingest_multiple_experiments_data(experiments):
         
         return len(processed_files) > 0
         
-            except Exception as e:
+    except Exception as e:
         st.error(f"Error processing simulation files: {str(e)}")
         return False
 
@@ -1040,14 +1238,25 @@ def render_multiple_chat_tab(simulation_ids, experiments):
         user_question = st.chat_input("Ask a comparative question about these simulations...")
 
         if user_question:
-            # Generate a response without immediate display
-            with st.spinner("Analyzing data from multiple simulations..."):
-                try:
-                    # For multiple experiments, we need to provide context about all experiments
-                    # We'll use the first experiment's run_dir but the system should search across all data
-                    answer = generate_response(user_question, run_dir=experiments[0].get("run_dir"))
-                except Exception as e:
-                    answer = f"Error generating response: {str(e)}"
+            with st.chat_message("user"):
+                st.markdown(user_question)
+
+            # Generate a response, rendering the answer as it streams in
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                streamed = []
+
+                def show_token(token):
+                    streamed.append(token)
+                    placeholder.markdown("".join(streamed))
+
+                with st.spinner("Analyzing data from multiple simulations..."):
+                    try:
+                        # For multiple experiments, we need to provide context about all experiments
+                        # We'll use the first experiment's run_dir but the system should search across all data
+                        answer = generate_response(user_question, run_dir=experiments[0].get("run_dir"), on_token=show_token)
+                    except Exception as e:
+                        answer = f"Error generating response: {str(e)}"
             
             # Save the conversation to database and rerun to display it
             success = save_multiple_chat_message(simulation_ids, user_question, answer)